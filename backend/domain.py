@@ -39,7 +39,7 @@ DOMAIN_CONTEXT_Geo = {
 
 DOMAIN_CONTEXT = {
     "Business Sector": {
-        "path": ["Business Sector"],
+        "path": ["Business Statistics"],
         "description": "Business sector statistics, number of companies, revenues"
     },
     "Monetary Statistics": {
@@ -59,7 +59,7 @@ DOMAIN_CONTEXT = {
         "description": "Ecology, environmental protection, natural resources"
     },
     "Employment and Wages": {
-        "path": ["Employment Wages"],
+        "path": ["Employment and Wages"],
         "description": "Jobs, unemployment, wage statistics"
     },
     "National Accounts": {
@@ -1,19 +1,178 @@
 import json
+import multiprocessing
 import os
-from flask import Flask, request, jsonify
+import select
+import socket
+import threading
+from functools import partial
+from flask import Flask, request, jsonify, make_response
 from flask_cors import CORS
 import sys
 
 from deep_translator import GoogleTranslator
 
-from mcp.app import handle_user_query, check_ollama_connection,load_data
+from mcp.app import handle_user_query, check_ollama_connection,load_data, SentenceTranslator
+from mcp.dedup import dedup_stats, dataset_version
+from mcp.bilingual import align_trees, detect_language
+from llm.llm import build_domain_index, call_ollama
+from llm.summaries import load_summaries, summarize_tables, summary_mtime
+from llm.semantic_cache import SEMANTIC_CACHE
+from llm.context import RequestContext, RequestCancelled, record_cancellation, cancellation_stats
+from llm.scheduler import LANES, SCHEDULER
+from profiling import (
+    is_admin, profiling_settings, update_profiling, start_request_profile, finish_request_profile,
+    list_profiles, load_profile, log_slow_query, memory_snapshot, start_tracemalloc_if_requested
+)
 from flask import render_template
 import time
+import prefork
+
+statistical_data = None
+statistical_index = None
+dataset_stats = {}
+table_summaries = {}
+# Modification time of the summary file that table_summaries was loaded from
+summaries_mtime = None
+summary_job = None
+# Other language editions of the dataset, e.g. {"ka": {"data", "index", "payloads", "summaries"}}
+localized_editions = {}
+
+# Summarize new or changed tables in the background when the server starts
+SUMMARIZE_ON_LOAD = os.environ.get("SUMMARIZE_ON_LOAD") == "1"
+
+# Seconds a query may run before its generations are abandoned
+DEFAULT_REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "300"))
+MAX_REQUEST_TIMEOUT = 600
+
+
+def client_disconnect_check(environ):
+    """Build a callable that reports whether the client closed its connection"""
+    sock = environ.get("werkzeug.socket")
+    if sock is None:
+        return None
+
+    def is_disconnected():
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                return False
+            # The body is already read, so a readable socket with no data means EOF
+            return sock.recv(1, socket.MSG_PEEK) == b""
+        except (OSError, ValueError):
+            return True
+
+    return is_disconnected
+
+
+def run_summary_job():
+    """Summarize new or changed tables into the summary file, in the background scheduler lane
+
+    Runs in its own process; the server picks the results up from the file
+    (see refresh_summaries).
+    """
+    if statistical_data is None:
+        print("⚠️  Summary job skipped: statistical data is not loaded")
+        return
+    ctx = RequestContext(lane="background", client="summarizer")
+    trees = [statistical_data] + [edition["data"] for edition in localized_editions.values()]
+    reused = {local_hash for edition in localized_editions.values() for local_hash in edition["payloads"]}
+    try:
+        summarize_tables(trees, partial(call_ollama, ctx=ctx), skip=reused)
+    except Exception as e:
+        print(f"❌ Summary job failed: {e}")
+
+
+def _reap_summary_job(process):
+    process.join()
+    SCHEDULER.reap(process.pid)
+
+
+def start_summary_job():
+    """Start the summary job in a separate process unless one is already running
+
+    Under the prefork server the parent forks it, so it outlives recycled
+    workers and its Ollama calls are reaped with it. The process is always
+    forked (whatever the platform's default start method): it needs the
+    loaded data and the shared SCHEDULER of this process.
+    """
+    global summary_job
+    if prefork.in_worker():
+        return prefork.request_job()
+    if summary_job is not None and summary_job.is_alive():
+        return False
+    summary_job = multiprocessing.get_context("fork").Process(target=run_summary_job, name="summaries", daemon=True)
+    summary_job.start()
+    threading.Thread(target=_reap_summary_job, args=(summary_job,), daemon=True).start()
+    return True
+
+
+def refresh_summaries():
+    """Reload the table summaries when the summary file changed since they were loaded"""
+    global table_summaries, summaries_mtime
+    mtime = summary_mtime()
+    if mtime == summaries_mtime:
+        return
+    summaries_mtime = mtime
+    table_summaries = load_summaries()
+    refresh_localized_summaries()
+
+
+def refresh_localized_summaries():
+    """Summaries for the other editions: their own, or the English one of an identical table"""
+    for edition in localized_editions.values():
+        edition["summaries"] = {
+            **table_summaries,
+            **{
+                local_hash: table_summaries[en_hash]
+                for local_hash, en_hash in edition["payloads"].items()
+                if en_hash in table_summaries
+            },
+        }
+
+
+def load_localized_editions():
+    """Load the Georgian edition and align it with the English one"""
+    ka_data = load_data("ka")
+    if not ka_data:
+        print("⚠️  Georgian data not loaded - Georgian questions will be machine-translated")
+        return {}
+    alignment = align_trees(statistical_data, ka_data)
+    print(f"🔗 Aligned {len(alignment['categories'])} Georgian categories with the English data; "
+          f"{len(alignment['payloads'])} tables/charts have identical numbers")
+    return {
+        "ka": {
+            "data": ka_data,
+            "index": build_domain_index(ka_data, alignment["categories"]),
+            "payloads": alignment["payloads"],
+            "summaries": {},
+        }
+    }
+
+
+def request_lane(data):
+    """Scheduler lane from the X-Priority header or "priority" field"""
+    lane = (request.headers.get("X-Priority") or data.get("priority") or "interactive").lower()
+    return lane if lane in LANES else "interactive"
+
+
+def request_client():
+    """Fair-queuing key: the API key when one is sent, otherwise the client address"""
+    return request.headers.get("X-API-Key") or request.remote_addr or "anonymous"
+
+
+def request_timeout(data):
+    """Deadline requested via X-Request-Timeout header or "timeout" field"""
+    value = request.headers.get("X-Request-Timeout") or data.get("timeout")
+    try:
+        timeout = float(value) if value else DEFAULT_REQUEST_TIMEOUT
+    except (TypeError, ValueError):
+        timeout = DEFAULT_REQUEST_TIMEOUT
+    return min(max(timeout, 1.0), MAX_REQUEST_TIMEOUT)
 
 
 def initialize_data():
     """Initialize the statistical data on server startup"""
-    global statistical_data
+    global statistical_data, statistical_index, dataset_stats, localized_editions
     print("🔄 Initializing API server...")
     
     # Check Ollama connection
@@ -21,6 +180,9 @@ def initialize_data():
         print("❌ Ollama connection failed - server will still start but queries will fail")
         # Don't return False here, let server start anyway
     
+    # Start tracemalloc before loading so dataset and index allocations are traced
+    start_tracemalloc_if_requested()
+
     # Load statistical data
     statistical_data = load_data()
     if not statistical_data:
@@ -29,6 +191,17 @@ def initialize_data():
         print("   python create_test_data.py")
         return False
     
+    # Precompute per-category tables and search text once, before any worker forks
+    statistical_index = build_domain_index(statistical_data)
+    localized_editions = load_localized_editions()
+    dataset_stats = dedup_stats(statistical_data)
+    dataset_stats['version'] = dataset_version(
+        [statistical_data] + [edition["data"] for edition in localized_editions.values()]
+    )
+    dataset_stats['languages'] = ['en'] + list(localized_editions)
+    refresh_summaries()
+    print(f"📝 {len(table_summaries)} precomputed table summaries")
+
     print(f"✅ Loaded {len(statistical_data)} statistical categories")
     return True
 
@@ -53,14 +226,30 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'data_loaded': statistical_data is not None,
-        'categories_count': len(statistical_data) if statistical_data else 0
+        'categories_count': len(statistical_data) if statistical_data else 0,
+        'dataset': dataset_stats,
+        'cancellations': cancellation_stats(),
+        'scheduler': SCHEDULER.stats(),
+        'semantic_cache': SEMANTIC_CACHE.stats()
     })
 
 @app.route('/api/query', methods=['POST'])
 def process_query():
+    """Process user query, profiling it when sampled or asked to"""
+    profiler = start_request_profile(request.headers)
+    if profiler is None:
+        return answer_query()
+
+    response = make_response(answer_query())
+    response.headers['X-Profile-Id'] = str(finish_request_profile(profiler))
+    return response
+
+
+def answer_query():
     """Process user query and return analysis"""
     global statistical_data
-    
+
+    back_translator = SentenceTranslator(source="auto", target="ka")
     try:
         llm_start_time = time.time()
         # Get query from request
@@ -86,12 +275,28 @@ def process_query():
             }), 500
         
         print(f"📝 Processing query: {user_query}")
+        refresh_summaries()
         
-        # Process query through LLM pipeline
-        result = handle_user_query(user_query, statistical_data)
-        translator = GoogleTranslator(source="auto", target="ka")
+        ctx = RequestContext(
+            timeout=request_timeout(data),
+            is_disconnected=client_disconnect_check(request.environ),
+            lane=request_lane(data),
+            client=request_client()
+        )
 
+        # Questions in a loaded language are answered in that language directly;
+        # otherwise analysis sentences are back-translated while the rest is still generating
+        direct = detect_language(user_query) in localized_editions
 
+        # Process query through LLM pipeline
+        result = handle_user_query(
+            user_query, statistical_data, statistical_index, ctx,
+            on_analysis_chunk=None if direct else back_translator.feed,
+            summaries=table_summaries,
+            cache=SEMANTIC_CACHE,
+            dataset_version=dataset_stats.get('version'),
+            localized=localized_editions
+        )
 
         llm_end_time = time.time()
         llm_duration = round(llm_end_time - llm_start_time, 2)
@@ -99,19 +304,31 @@ def process_query():
 
         # Format response for frontend
         response_text = f"📌 {result['title']}\n\n"
-        
-        if result.get('raw_table'):
-            response_text += f"📊 Found {len(result['raw_table'])} tables\n"
-        
-        if result.get('raw_charts'):
-            response_text += f"📈 Found {len(result['raw_charts'])} charts\n"
+
+        if result.get('language') == 'ka':
+            if result.get('raw_table'):
+                response_text += f"📊 ნაპოვნი მონაცემები: {len(result['raw_table'])} ცხრილი\n"
+            if result.get('raw_charts'):
+                response_text += f"📈 ნაპოვნი დიაგრამები: {len(result['raw_charts'])}\n"
+            response_text += f"\n🧠 ანალიზი:\n{result['analysis']}"
+        else:
+            if result.get('raw_table'):
+                response_text += f"📊 Found {len(result['raw_table'])} tables\n"
+
+            if result.get('raw_charts'):
+                response_text += f"📈 Found {len(result['raw_charts'])} charts\n"
+
+            response_text += "\n🧠 Analysis:"
+            ctx.check("back-translation")
+            with ctx.stage("back_translation"):
+                header = GoogleTranslator(source="auto", target="ka").translate(response_text)
+                response_text = f"{header}\n{back_translator.finish(result['analysis'])}"
 
         end_time = time.time()
         duration = round(end_time - start_time, 2)
-        response_text += f"\n🧠 Analysis:\n{result['analysis']}"
-        response_text = translator.translate(response_text)
 
-        print(f"\n\n⏱️ Response time: {llm_duration} seconds, Output time: {duration}")
+        print(f"\n\n⏱️ Response time: {llm_duration} seconds, Output time: {duration}, Stages: {ctx.timings}")
+        log_slow_query(user_query, end_time - llm_start_time, ctx)
 
         return jsonify({
             'success': True,
@@ -120,11 +337,26 @@ def process_query():
                 'title': result['title'],
                 'analysis': result['analysis'],
                 'tables_count': len(result.get('raw_table', [])),
-                'charts_count': len(result.get('raw_charts', []))
+                'charts_count': len(result.get('raw_charts', [])),
+                'answer_path': result.get('answer_path', 'llm'),
+                'language': result.get('language', 'en'),
+                'cache': result.get('cache'),
+                'timings': ctx.timings,
+                'queue_wait': round(ctx.queue_wait, 3)
             }
         })
-        
+
+    except RequestCancelled as e:
+        back_translator.cancel()
+        record_cancellation(e.reason)
+        print(f"🛑 {e}")
+        return jsonify({
+            'success': False,
+            'error': 'The query took too long and was cancelled. Please try again.'
+        }), 504
+
     except Exception as e:
+        back_translator.cancel()
         error_msg = f"Error processing query: {str(e)}"
         print(f"❌ {error_msg}")
         return jsonify({
@@ -150,6 +382,61 @@ def get_categories():
         'categories': categories
     })
 
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """Show or change request profiling and slow-query settings"""
+    if not is_admin(request.headers):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+
+    if request.method == 'POST':
+        settings = request.get_json(silent=True)
+        if not isinstance(settings, dict):
+            return jsonify({'success': False, 'error': 'Expected a JSON object of settings'}), 400
+        try:
+            update_profiling(settings)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'settings': profiling_settings(),
+        'profiles': list_profiles()
+    })
+
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Collapsed stacks of a profiled request, for flamegraph tools"""
+    if not is_admin(request.headers):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    profile = load_profile(profile_id)
+    if profile is None:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+    return profile, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+@app.route('/api/admin/memory/snapshot', methods=['POST'])
+def take_memory_snapshot():
+    """tracemalloc snapshot of the server, diffed against the previous one"""
+    if not is_admin(request.headers):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    return jsonify({'success': True, 'memory': memory_snapshot()})
+
+
+@app.route('/api/admin/summaries/rebuild', methods=['POST'])
+def rebuild_summaries():
+    """Summarize new or changed tables in the background"""
+    if not is_admin(request.headers):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    started = start_summary_job()
+    refresh_summaries()
+    return jsonify({
+        'success': True,
+        'started': started,
+        'summaries': len(table_summaries)
+    }), 202 if started else 200
+
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
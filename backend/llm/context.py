@@ -0,0 +1,81 @@
+"""
+Per-request context: deadline, client-disconnect detection and cancellation
+"""
+
+import multiprocessing
+import time
+from contextlib import contextmanager
+
+# Cancellation counters, created at import so prefork workers share them
+CANCELLATIONS = {
+    "deadline": multiprocessing.Value("i", 0),
+    "disconnect": multiprocessing.Value("i", 0),
+}
+
+
+class RequestCancelled(Exception):
+    """Raised when a request passed its deadline or its client went away"""
+
+    def __init__(self, reason, stage=""):
+        super().__init__(f"request cancelled ({reason}) during {stage or 'processing'}")
+        self.reason = reason
+        self.stage = stage
+
+
+def record_cancellation(reason):
+    counter = CANCELLATIONS.get(reason)
+    if counter is not None:
+        with counter.get_lock():
+            counter.value += 1
+
+
+def cancellation_stats():
+    return {reason: counter.value for reason, counter in CANCELLATIONS.items()}
+
+
+class RequestContext:
+    """Carries a request's deadline and disconnect check through every stage"""
+
+    def __init__(self, timeout=None, is_disconnected=None, lane="interactive", client="anonymous"):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.is_disconnected = is_disconnected
+        self.lane = lane
+        self.client = client
+        self.timings = {}
+        self.queue_wait = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        """Record the wall-clock seconds spent in a pipeline stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = round(self.timings.get(name, 0) + elapsed, 3)
+
+    def remaining(self):
+        """Seconds left before the deadline (None when there is no deadline)"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel_reason(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "deadline"
+        if self.is_disconnected is not None and self.is_disconnected():
+            return "disconnect"
+        return None
+
+    def check(self, stage=""):
+        """Raise RequestCancelled if the work should be abandoned"""
+        reason = self.cancel_reason()
+        if reason:
+            raise RequestCancelled(reason, stage)
+
+    def timeout(self, limit):
+        """Clamp a network timeout to the time left before the deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return max(0.1, min(limit, remaining))
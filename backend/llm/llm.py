@@ -1,47 +1,151 @@
 import json
+import re
+import threading
 import requests
-from domain import DOMAIN_CONTEXT
-
+from concurrent.futures import ThreadPoolExecutor
+from domain import DOMAIN_CONTEXT, DOMAIN_CONTEXT_Geo
+from llm.context import RequestContext, RequestCancelled
+from llm.lookup import direct_lookup
+from llm.scheduler import SCHEDULER
+from llm.summaries import compact_tables
+
+# Shared pool for retrieval and translation work that runs alongside the LLM calls
+STAGE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="stage")
+
+# How many keyword-matched domains to retrieve while routing is still running
+SPECULATIVE_DOMAINS = 2
+STOP_WORDS = {"the", "and", "for", "how", "many", "much", "what", "which", "are", "was", "were", "with", "from",
+              "რამდენი", "რამდენია", "როგორია", "როგორი", "არის", "იყო", "წელს", "წლის", "საქართველოში"}
+# Inflected words match a domain word when they share this long a prefix
+STEM_LENGTH = 5
+
+# Routing only needs a few domain names back; the small budget also lets the
+# scheduler run it ahead of long analysis generations
+ROUTING_NUM_PREDICT = 64
+
+# call_ollama reports failures as text starting with this word ("error")
+LLM_ERROR_PREFIX = "შეცდომა"
+
+# How often a request waiting on Ollama checks its deadline and client connection
+CANCEL_POLL_SECONDS = 0.5
+
+
+def _stream_generate(payload, ctx=None, on_chunk=None):
+    """Stream a generation, aborting the connection as soon as ctx is cancelled"""
+    response = requests.post(
+        "http://localhost:11434/api/generate",
+        json=payload,
+        stream=True,
+        timeout=ctx.timeout(300) if ctx else 300
+    )
+    with response:
+        if response.status_code != 200:
+            return f"შეცდომა ollama-ს მოთხოვნისას: {response.status_code} - {response.text}"
 
-def call_ollama(prompt: str, model="llama3:8b", temperature=0.1):
-    """Call Ollama API locally with improved error handling"""
+        parts = []
+        for line in response.iter_lines():
+            if ctx is not None:
+                # Leaving the with-block closes the socket, which makes Ollama stop generating
+                ctx.check("ollama generation")
+            if not line:
+                continue
+            chunk = json.loads(line)
+            parts.append(chunk.get("response", ""))
+            if on_chunk is not None and chunk.get("response"):
+                on_chunk(chunk["response"])
+            if chunk.get("done"):
+                break
+        return "".join(parts).strip()
+
+
+def _generate_abandonable(payload, ctx, on_chunk, ticket):
+    """Run a generation on its own thread so the request can give up while it is blocked
+
+    requests cannot be interrupted while Ollama is still evaluating the prompt,
+    so the caller polls ctx instead and raises RequestCancelled as soon as the
+    request is cancelled. The thread closes the connection at the next chunk
+    and only then releases the scheduler ticket, so the abandoned generation
+    still counts against the Ollama limit while Ollama works on it.
+    """
+    outcome = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            outcome["text"] = _stream_generate(payload, ctx, on_chunk)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            SCHEDULER.release(ticket)
+            done.set()
+
+    threading.Thread(target=run, name="ollama-stream", daemon=True).start()
+    while not done.wait(CANCEL_POLL_SECONDS):
+        reason = ctx.cancel_reason()
+        if reason:
+            raise RequestCancelled(reason, "ollama generation")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["text"]
+
+
+def call_ollama(prompt: str, model="llama3:8b", temperature=0.1, ctx=None, on_chunk=None, num_predict=512):
+    """Call Ollama API locally with improved error handling
+
+    on_chunk, if given, receives each piece of text as Ollama streams it.
+    The call waits in the scheduler lane and client queue named by ctx.
+    """
     try:
+        if ctx is not None:
+            ctx.check("ollama")
+
         # First check if ollama is running
         health_response = requests.get("http://localhost:11434/api/tags", timeout=5)
         if health_response.status_code != 200:
             return "შეცდომა: Ollama სერვისი არ მუშაობს. გთხოვთ დაყენოთ ollama serve"
-        
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": model,
-                "prompt": prompt,
-                "system": "You are a Georgian statistical assistant.",
-                "temperature": temperature,
-                "stream": False,
-                "options": {
-                    "timeout": 300,
-                    "num_ctx": 2048,
-                    "num_predict": 512,
-                }
-            },
-            timeout=300
-        )
 
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("response", "").strip()
-        else:
-            return f"შეცდომა ollama-ს მოთხოვნისას: {response.status_code} - {response.text}"
-            
-    except requests.exceptions.Timeout:
-        return "შეცდომა: Ollama-ს პასუხის ლოდინის დრო ამოიწურა. სცადეთ უფრო მოკლე კითხვით."
-    except requests.exceptions.ConnectionError:
-        return "შეცდომა: Ollama-სთან კავშირი ვერ დამყარდა. დარწმუნდით რომ ollama serve გაშვებულია."
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "system": "You are a Georgian statistical assistant.",
+            "temperature": temperature,
+            "stream": True,
+            "options": {
+                "timeout": 300,
+                "num_ctx": 2048,
+                "num_predict": num_predict,
+            }
+        }
+
+        lane = ctx.lane if ctx is not None else "interactive"
+        client = ctx.client if ctx is not None else "local"
+        ticket, waited = SCHEDULER.acquire(lane, client, num_predict, ctx)
+        if ctx is None:
+            try:
+                return _stream_generate(payload, ctx, on_chunk)
+            finally:
+                SCHEDULER.release(ticket)
+        ctx.queue_wait += waited
+        return _generate_abandonable(payload, ctx, on_chunk, ticket)
+
     except requests.exceptions.RequestException as e:
+        # A timeout or dropped stream caused by the deadline or a disconnect is a
+        # cancellation, not an Ollama failure
+        reason = ctx.cancel_reason() if ctx is not None else None
+        if reason:
+            raise RequestCancelled(reason, "ollama") from e
+        if isinstance(e, requests.exceptions.Timeout):
+            return "შეცდომა: Ollama-ს პასუხის ლოდინის დრო ამოიწურა. სცადეთ უფრო მოკლე კითხვით."
+        if isinstance(e, requests.exceptions.ConnectionError):
+            return "შეცდომა: Ollama-სთან კავშირი ვერ დამყარდა. დარწმუნდით რომ ollama serve გაშვებულია."
         return f"შეცდომა ollama-სთან კავშირისას: {str(e)}"
 
 
+def is_llm_error(text):
+    """Whether an LLM response is one of call_ollama's error messages"""
+    return text.strip().startswith(LLM_ERROR_PREFIX)
+
+
 def query_handler(data, path):
     """Navigate through the data structure following the given path"""
     for category in data:
@@ -50,13 +154,26 @@ def query_handler(data, path):
     return []
 
 
-def extract_tables_and_charts(data):
-    """Recursively walk the data to collect all tables and charts"""
+def extract_tables_and_charts(data, hashes=None):
+    """Recursively walk the data to collect all unique tables and charts
+
+    hashes, if given, is filled with {id(payload): content hash} from the
+    hashes the loader stored on the nodes.
+    """
     tables = []
     charts = []
+    seen = set()
 
     def walk(node):
         if isinstance(node, dict):
+            if node.get("type") in ("table", "chart"):
+                # The same payload can sit at several tree locations; keep it once
+                key = node.get("hash") or id(node.get("data"))
+                if key in seen:
+                    return
+                seen.add(key)
+                if hashes is not None and node.get("hash"):
+                    hashes[id(node.get("data"))] = node["hash"]
             if node.get("type") == "table":
                 tables.append(node.get("data", []))
             elif node.get("type") == "chart":
@@ -74,9 +191,40 @@ def extract_tables_and_charts(data):
     return tables, charts
 
 
-def filter_tables_by_query(tables, query):
+def table_text(table):
+    """Lowercased text of every cell in a table, used for keyword matching"""
+    return "\n".join(
+        str(value).lower()
+        for row in table
+        for value in row.values()
+    )
+
+
+def build_domain_index(data, names=None):
+    """Precompute tables, charts and searchable text for each top-level category
+
+    names maps category names to index keys, e.g. Georgian category names to
+    the English ones that DOMAIN_CONTEXT paths use.
+    """
+    names = names or {}
+    index = {}
+    for category in data:
+        hashes = {}
+        tables, charts = extract_tables_and_charts(category, hashes)
+        index[names.get(category.get("name"), category.get("name"))] = {
+            "tables": tables,
+            "charts": charts,
+            "texts": [table_text(table) for table in tables],
+            "hashes": hashes,
+        }
+    return index
+
+
+def filter_tables_by_query(tables, query, texts=None):
     """Filter only the tables that contain query keywords"""
     query = query.lower()
+    if texts is not None:
+        return [table for table, text in zip(tables, texts) if query in text]
     return [
         table for table in tables
         if any(
@@ -86,8 +234,115 @@ def filter_tables_by_query(tables, query):
     ]
 
 
-def llm_full_pipeline(user_query: str, raw_data, llm=call_ollama):
-    """Full pipeline: map → retrieve → analyze with improved error handling"""
+def retrieve_domain(data, domain, user_query, index=None):
+    """Collect the query-relevant tables, all tables, all charts and the payload hashes of a single domain"""
+    path = DOMAIN_CONTEXT[domain]["path"]
+    if index is not None:
+        entry = index.get(path[0])
+        if not entry:
+            return [], [], [], {}
+        tables = entry["tables"]
+        return filter_tables_by_query(tables, user_query, entry["texts"]), tables, entry["charts"], entry["hashes"]
+
+    raw_result = query_handler(data, path)
+    hashes = {}
+    tables, charts = extract_tables_and_charts(raw_result, hashes)
+    return filter_tables_by_query(tables, user_query), tables, charts, hashes
+
+
+def _words(text):
+    return {w for w in re.findall(r"[^\W\d_]+", text.lower()) if len(w) > 2} - STOP_WORDS
+
+
+def _same_stem(word, other):
+    stem = min(len(word), len(other), STEM_LENGTH)
+    return word[:stem] == other[:stem]
+
+
+def rank_candidate_domains(user_query, limit=SPECULATIVE_DOMAINS):
+    """Cheap keyword guess at the likely domains, used to start retrieval early
+
+    Both the English and the Georgian domain names and descriptions are matched.
+    """
+    words = _words(user_query)
+    scored = []
+    for domain, info in DOMAIN_CONTEXT.items():
+        name_ka = DOMAIN_NAMES_KA.get(domain, "")
+        description_ka = DOMAIN_CONTEXT_Geo.get(name_ka, {}).get("description", "")
+        vocab = _words(f"{domain} {info['description']} {name_ka} {description_ka}")
+        score = sum(1 for w in words if any(_same_stem(w, v) for v in vocab))
+        if score:
+            scored.append((score, domain))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [domain for _, domain in scored[:limit]]
+
+
+LANGUAGE_INSTRUCTIONS = {
+    "ka": "\nWrite the answer in Georgian (ქართულად).",
+}
+
+# Georgian display names of the domains, in the same order as DOMAIN_CONTEXT
+DOMAIN_NAMES_KA = dict(zip(DOMAIN_CONTEXT, DOMAIN_CONTEXT_Geo))
+
+
+def _title_domains(domains, language):
+    if language == "ka":
+        return ', '.join(DOMAIN_NAMES_KA.get(domain, domain) for domain in domains)
+    return ', '.join(domains)
+
+
+def lookup_all_domains(user_query, index, language="en"):
+    """Try direct_lookup on every indexed table; returns (lookup, domain) or (None, None)
+
+    The same confidence and ambiguity checks apply, so a value found in
+    several domains is left to routing.
+    """
+    domains = {info["path"][0]: domain for domain, info in DOMAIN_CONTEXT.items()}
+    tables, table_domains = [], {}
+    for key, entry in index.items():
+        for table in entry["tables"]:
+            if id(table) not in table_domains:
+                table_domains[id(table)] = domains.get(key, key)
+                tables.append(table)
+    lookup = direct_lookup(user_query, tables, language)
+    if not lookup:
+        return None, None
+    return lookup, table_domains[id(lookup["table"])]
+
+
+def _lookup_result(lookup, domains, language, ctx, on_analysis_chunk):
+    print(f"⚡ პირდაპირი პასუხი ცხრილიდან (confidence {lookup['confidence']})")
+    if on_analysis_chunk is not None:
+        on_analysis_chunk(lookup["answer"])
+    return {
+        "title": f"{_title_domains(domains, language)} - შედეგი",
+        "raw_table": [lookup["table"]],
+        "raw_charts": [],
+        "analysis": lookup["answer"],
+        "answer_path": "lookup",
+        "language": language,
+        "timings": ctx.timings
+    }
+
+
+def llm_full_pipeline(user_query: str, raw_data, llm=call_ollama, index=None, ctx=None, on_analysis_chunk=None,
+                      summaries=None, language="en"):
+    """Full pipeline: map → retrieve → analyze with improved error handling
+
+    With an index, single-value questions are first looked up in every table,
+    so a confident match is answered without any LLM call.
+
+    Retrieval for the keyword-likely domains starts while the LLM is still
+    routing, and the matched domains are retrieved in parallel. ctx stops the
+    pipeline between stages once the request's deadline passes or its client
+    disconnects (RequestCancelled is raised) and collects per-stage timings.
+    on_analysis_chunk receives the analysis text as it streams. LLM failures
+    are returned with "error": True (and no answer_path). Tables with a
+    precomputed summary (see llm.summaries) are sent as summary plus a few rows.
+    language is the language of the question and of raw_data ("en" or "ka");
+    the analysis is written in that language.
+    """
+    ctx = ctx or RequestContext()
     if isinstance(raw_data, str):
         try:
             data = json.loads(raw_data)
@@ -111,14 +366,31 @@ Available domains: {', '.join(valid_domains)}
 Your task: Identify only the relevant domains that can answer this question. 
 Return the domain names separated by "__" without any extra explanation."""
 
+    ctx.check("domain routing")
+
+    # Plain single-value questions are answered straight from the tables, before any LLM call
+    if index is not None:
+        with ctx.stage("lookup"):
+            lookup, domain = lookup_all_domains(user_query, index, language)
+        if lookup:
+            return _lookup_result(lookup, [domain], language, ctx, on_analysis_chunk)
+
+    # Speculative retrieval: runs on the stage pool while routing waits on the LLM
+    retrievals = {
+        domain: STAGE_POOL.submit(retrieve_domain, data, domain, user_query, index)
+        for domain in rank_candidate_domains(user_query)
+    }
+
     print("🔍 ვიძებ შესაბამის თემატიკას...")
-    domain_response = llm(domain_prompt).strip().lower().strip('"')
+    with ctx.stage("routing"):
+        domain_response = llm(domain_prompt, num_predict=ROUTING_NUM_PREDICT).strip().lower().strip('"')
 
     if "შეცდომა" in domain_response or "error" in domain_response:
         return {
             "title": "შეცდომა AI სისტემაში",
             "raw_table": [],
-            "analysis": domain_response
+            "analysis": domain_response,
+            "error": True
         }
 
     response_parts = [part.strip() for part in domain_response.split("__")]
@@ -144,40 +416,76 @@ Return the domain names separated by "__" without any extra explanation."""
 
     print(f"✅ ნაპოვნია თემატიკა: {', '.join(matched_domain)}")
 
-    all_tables, all_charts = [], []
-    for domain in matched_domain:
-        path = DOMAIN_CONTEXT[domain]["path"]
-        raw_result = query_handler(data, path)
-        tables, charts = extract_tables_and_charts(raw_result)
-        filtered_tables = filter_tables_by_query(tables, user_query)
-        all_tables.extend(filtered_tables)
-        all_charts.extend(charts)
+    ctx.check("retrieval")
+
+    all_tables, all_charts, domain_tables, table_hashes = [], [], [], {}
+    with ctx.stage("retrieval"):
+        for domain in matched_domain:
+            if domain not in retrievals:
+                retrievals[domain] = STAGE_POOL.submit(retrieve_domain, data, domain, user_query, index)
+        seen = set()
+        for domain in matched_domain:
+            filtered_tables, tables, charts, hashes = retrievals[domain].result()
+            table_hashes.update(hashes)
+            # Domains can share payloads; identical ones are the same object after loading
+            all_tables.extend(t for t in filtered_tables if id(t) not in seen)
+            domain_tables.extend(t for t in tables if id(t) not in seen)
+            all_charts.extend(c for c in charts if id(c) not in seen)
+            seen.update(map(id, tables))
+            seen.update(map(id, charts))
+
+    # A lookup that was ambiguous across all domains can be clear within the routed ones
+    title_domains = _title_domains(matched_domain, language)
+    with ctx.stage("lookup"):
+        lookup = direct_lookup(user_query, domain_tables, language)
+    if lookup:
+        return _lookup_result(lookup, matched_domain, language, ctx, on_analysis_chunk)
 
     if not all_tables and not all_charts:
         return {
-            "title": f"{', '.join(matched_domain)} - მონაცემები ვერ მოიძებნა",
+            "title": f"{title_domains} - მონაცემები ვერ მოიძებნა",
             "raw_table": [],
             "analysis": "შესაბამისი მონაცემები ვერ მოიძებნა. შესაძლოა მონაცემების ბაზა არასრულია ან კითხვა არასწორად არის ფორმულირებული."
         }
 
     print(f"📊 ნაპოვნია: {len(all_tables)} ცხრილი, {len(all_charts)} დიაგრამა")
 
-    limited_table = all_tables
     limited_charts = all_charts[:1] if all_charts else []
 
-    analysis_prompt = f"""Question: "{user_query}"
+    with ctx.stage("prompt_build"):
+        limited_table = compact_tables(all_tables, user_query, summaries, table_hashes)
+        analysis_prompt = f"""Question: "{user_query}"
 
 Data:
 {json.dumps(limited_table, ensure_ascii=False, indent=1)}...
 
-Provide a clear, concise analysis based only on the relevant data."""
+Provide a clear, concise analysis based only on the relevant data.{LANGUAGE_INSTRUCTIONS.get(language, "")}"""
+
+    ctx.check("analysis")
 
     print("🧠 ვანალიზებ მონაცემებს...")
-    analysis = llm(analysis_prompt)
+    with ctx.stage("analysis"):
+        if on_analysis_chunk is not None:
+            analysis = llm(analysis_prompt, on_chunk=on_analysis_chunk)
+        else:
+            analysis = llm(analysis_prompt)
+
+    if is_llm_error(analysis):
+        return {
+            "title": "შეცდომა AI სისტემაში",
+            "raw_table": [],
+            "analysis": analysis.strip(),
+            "error": True,
+            "language": language,
+            "timings": ctx.timings
+        }
 
     return {
-        "title": f"{', '.join(matched_domain)} - შედეგი",
+        "title": f"{title_domains} - შედეგი",
         "raw_table": all_tables,
         "raw_charts": all_charts,
-        "analysis": analysis.strip()
+        "analysis": analysis.strip(),
+        "answer_path": "llm",
+        "language": language,
+        "timings": ctx.timings
     }
@@ -0,0 +1,171 @@
+"""
+Deterministic lookup for single-value questions ("Turnover in 2022")
+
+The query is split into a metric and a period, the metric is matched against
+the row labels of the candidate tables and the period against their columns.
+A confident, unambiguous match is answered from a template without the LLM.
+"""
+
+import re
+
+# Minimum metric/row-label match score for answering without the LLM
+LOOKUP_CONFIDENCE = 0.8
+# A different value scoring within this margin of the best makes the match ambiguous
+AMBIGUITY_MARGIN = 0.1
+
+STOP_WORDS = {
+    "the", "a", "an", "in", "of", "for", "at", "on", "by", "to", "and", "or", "is", "was", "were",
+    "what", "which", "how", "many", "much", "did", "does", "value", "year", "quarter",
+    "total", "tell", "me", "show", "give", "georgia", "georgian",
+    "რა", "რამდენი", "რამდენია", "იყო", "არის", "როგორია", "როგორი", "წელს", "წელი", "წლის",
+    "წელში", "კვარტალში", "კვარტალი", "საქართველოში", "და",
+}
+UNIT_WORDS = {
+    "billion", "million", "thousand", "thousands", "mil", "gel", "usd", "eur",
+    "percentage", "percent", "person", "persons", "change", "number",
+    "მილიარდი", "მილიონი", "ათასი", "ლარი", "აშშ", "დოლარი", "პროცენტი", "კაცი", "რაოდენობა",
+}
+
+ANSWER_TEMPLATES = {
+    "en": "According to Geostat data, {label} for {period}: {value}.",
+    "ka": "საქსტატის მონაცემებით, {label} ({period}): {value}.",
+}
+
+# Questions about more than one value (comparisons, ranges, growth) go to the LLM
+COMPARISON_WORDS = re.compile(
+    r"\b(?:vs|versus|compared?|comparison|compare|growth|grew|change[sd]?|increased?|decreased?|"
+    r"difference|between|trend|from|since)\b"
+    r"|შედარებ|ზრდა|გაიზარდა|შემცირ|ცვლილებ|შორის|ვიდრე|დინამიკ"
+)
+
+QUARTERS = {"1": "I", "2": "II", "3": "III", "4": "IV",
+            "first": "I", "second": "II", "third": "III", "fourth": "IV",
+            "1st": "I", "2nd": "II", "3rd": "III", "4th": "IV",
+            "i": "I", "ii": "II", "iii": "III", "iv": "IV"}
+
+
+def _tokens(text):
+    words = re.findall(r"[^\W\d_]\w*", str(text).lower())
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words}
+
+
+def parse_period(query):
+    """Return the period the query asks about as "2022" or "2024II" (or None)
+
+    None also means the query asks about more than one period ("2022 vs
+    2021", "Q1 and Q2 2024") or compares values, which a single cell cannot
+    answer.
+    """
+    text = query.lower()
+    if COMPARISON_WORDS.search(text):
+        return None
+
+    years = set(re.findall(r"\b((?:19|20)\d{2})\b", text))
+    if len(years) != 1:
+        return None
+    year = years.pop()
+
+    quarters = re.findall(r"\b(?:19|20)\d{2}\s*-?\s*(i{1,3}|iv)\b", text)
+    quarters += re.findall(r"\bq([1-4])\b", text)
+    quarters += re.findall(
+        r"\b(first|second|third|fourth|1st|2nd|3rd|4th|i{1,3}|iv)\s+(?:quarter|კვარტალ)", text
+    )
+    quarters = {QUARTERS[quarter] for quarter in quarters}
+    if len(quarters) > 1:
+        return None
+    return year + quarters.pop() if quarters else year
+
+
+def normalize_period_column(column):
+    """Map column headers like "2024*", "I 24*", "2025-I" to the parse_period form"""
+    key = str(column).replace("*", "").replace("-", "").replace(" ", "").upper()
+    match = re.fullmatch(r"((?:19|20)\d{2})(I{1,3}|IV)?", key)
+    if match:
+        return match.group(1) + (match.group(2) or "")
+    match = re.fullmatch(r"(I{1,3}|IV)(\d{2})", key)
+    if match:
+        return "20" + match.group(2) + match.group(1)
+    return None
+
+
+def metric_tokens(query):
+    """Content words of the query once the period and filler words are removed"""
+    text = re.sub(r"\b(?:19|20)\d{2}\S*", " ", query.lower())
+    text = re.sub(r"\bq[1-4]\b", " ", text)
+    return _tokens(text) - STOP_WORDS - set(QUARTERS)
+
+
+def _label_score(query_tokens, label):
+    label_tokens = _tokens(label) - STOP_WORDS
+    content = label_tokens - UNIT_WORDS or label_tokens
+    if not content or not query_tokens:
+        return 0.0
+    matched = query_tokens & label_tokens
+    precision = len(matched) / len(query_tokens)
+    recall = len(matched & content) / len(content)
+    if not precision or not recall:
+        return 0.0
+    return 2 * precision * recall / (precision + recall)
+
+
+def _row_label(row):
+    if "" in row:
+        return row[""]
+    return next(iter(row.values()), None)
+
+
+def _is_value(value):
+    return value is not None and bool(re.search(r"\d", str(value)))
+
+
+def direct_lookup(query, tables, language="en"):
+    """Answer a single-value question straight from the tables (in language)
+
+    Returns a dict with the answer text, matched label, period, value,
+    table and confidence, or None when the match is not confident enough.
+    """
+    period = parse_period(query)
+    query_tokens = metric_tokens(query)
+    if not period or not query_tokens:
+        return None
+
+    candidates = []
+    for table in tables:
+        if not table:
+            continue
+        columns = [c for c in table[0].keys() if normalize_period_column(c) == period]
+        if not columns:
+            continue
+        column = columns[0]
+        for row in table:
+            label = _row_label(row)
+            value = row.get(column)
+            if not label or not _is_value(value):
+                continue
+            score = _label_score(query_tokens, label)
+            if score:
+                candidates.append((score, label, column, str(value).strip(), table))
+
+    if not candidates:
+        return None
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    score, label, column, value, table = candidates[0]
+    if score < LOOKUP_CONFIDENCE:
+        return None
+    for other in candidates[1:]:
+        if other[0] < score - AMBIGUITY_MARGIN:
+            break
+        if other[3] != value:
+            return None
+
+    return {
+        "answer": ANSWER_TEMPLATES.get(language, ANSWER_TEMPLATES["en"]).format(
+            label=label.strip(), period=column.replace("*", "").strip(), value=value
+        ),
+        "label": label,
+        "period": column,
+        "value": value,
+        "table": table,
+        "confidence": round(score, 2),
+    }
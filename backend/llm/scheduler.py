@@ -0,0 +1,172 @@
+"""
+Priority-aware fair scheduler in front of the Ollama client
+
+- Lanes: interactive > batch > background, strict priority between lanes
+- Per-lane concurrency caps plus an overall cap (the number of concurrent
+  Ollama generations)
+- Within a lane, weighted fair queuing per client: each call gets a virtual
+  finish time of max(clock, client's last finish) + cost / weight, and the
+  smallest finish time runs first
+- The cost is the expected num_predict, so short jobs (routing prompts) are
+  preferred over long analysis generations (shortest-job-first hint)
+
+The queue, the virtual clock and the client finish times live in shared
+memory created at import, so prefork workers forked later schedule against
+one another rather than each seeing only its own requests. Every waiting or
+running call records its process id; the prefork parent reaps the calls of a
+worker that exits, so a killed worker cannot keep a generation slot.
+"""
+
+import ctypes
+import multiprocessing
+import os
+import time
+import zlib
+
+LANES = ("interactive", "batch", "background")
+LANE_LIMITS = {"interactive": 2, "batch": 1, "background": 1}
+TOTAL_LIMIT = 2
+
+# Relative share of a lane for specific clients (API keys); others weigh 1
+CLIENT_WEIGHTS = {}
+
+# Calls that can wait or run at the same time, across all workers
+MAX_CALLS = 256
+# Clients are hashed into this many fair-queuing tags (collisions share a tag)
+CLIENT_TAGS = 1024
+
+FREE, WAITING, RUNNING = 0, 1, 2
+
+
+class _Call(ctypes.Structure):
+    _fields_ = [
+        ("state", ctypes.c_int),
+        ("pid", ctypes.c_int),
+        ("lane", ctypes.c_int),
+        ("seq", ctypes.c_long),
+        ("finish", ctypes.c_double),
+        ("virtual_start", ctypes.c_double),
+    ]
+
+
+class OllamaScheduler:
+    """Decide which waiting Ollama call runs next, across threads and processes"""
+
+    def __init__(self, lane_limits=None, total_limit=TOTAL_LIMIT, client_weights=None):
+        self.lane_limits = dict(lane_limits or LANE_LIMITS)
+        self.client_weights = client_weights if client_weights is not None else CLIENT_WEIGHTS
+        self._cond = multiprocessing.Condition()
+        self._calls = multiprocessing.Array(_Call, MAX_CALLS, lock=False)
+        self._tags = multiprocessing.Array(ctypes.c_double, CLIENT_TAGS, lock=False)
+        self._clock = multiprocessing.RawValue(ctypes.c_double, 0.0)
+        self._seq = multiprocessing.RawValue(ctypes.c_long, 0)
+        self._total_limit = multiprocessing.RawValue(ctypes.c_int, total_limit)
+
+    @property
+    def total_limit(self):
+        return self._total_limit.value
+
+    def set_total_limit(self, limit):
+        """Change the overall cap, e.g. to the Ollama concurrency of a prefork server"""
+        with self._cond:
+            self._total_limit.value = limit
+            self._cond.notify_all()
+
+    def _counts(self, state):
+        counts = [0] * len(LANES)
+        for call in self._calls:
+            if call.state == state:
+                counts[call.lane] += 1
+        return counts
+
+    def _next_call(self):
+        """Slot of the call that should start now, or None"""
+        running = self._counts(RUNNING)
+        if sum(running) >= self.total_limit:
+            return None
+        best = {}
+        for slot, call in enumerate(self._calls):
+            if call.state != WAITING:
+                continue
+            current = best.get(call.lane)
+            if current is None or (call.finish, call.seq) < (self._calls[current].finish, self._calls[current].seq):
+                best[call.lane] = slot
+        for lane, name in enumerate(LANES):
+            if lane in best and running[lane] < self.lane_limits[name]:
+                return best[lane]
+        return None
+
+    def _free_slot(self):
+        for slot, call in enumerate(self._calls):
+            if call.state == FREE:
+                return slot
+        return None
+
+    def acquire(self, lane="interactive", client="anonymous", cost=512, ctx=None):
+        """Block until this call may run; returns (ticket, seconds spent waiting)
+
+        Pass the ticket to release(). With ctx, waiting stops
+        (RequestCancelled) once the request is cancelled.
+        """
+        lane_index = LANES.index(lane) if lane in LANES else 0
+        start = time.monotonic()
+        with self._cond:
+            slot = self._free_slot()
+            while slot is None:
+                self._cond.wait(timeout=0.5)
+                if ctx is not None:
+                    ctx.check("ollama queue")
+                slot = self._free_slot()
+
+            tag = zlib.crc32(str(client).encode("utf-8")) % CLIENT_TAGS
+            weight = self.client_weights.get(client, 1)
+            virtual_start = max(self._clock.value, self._tags[tag])
+            finish = virtual_start + cost / weight
+            self._tags[tag] = finish
+            self._seq.value += 1
+            self._calls[slot] = _Call(WAITING, os.getpid(), lane_index, self._seq.value, finish, virtual_start)
+            self._cond.notify_all()
+
+            try:
+                while self._next_call() != slot:
+                    self._cond.wait(timeout=0.5)
+                    if ctx is not None:
+                        ctx.check("ollama queue")
+            except BaseException:
+                self._calls[slot].state = FREE
+                self._cond.notify_all()
+                raise
+
+            self._calls[slot].state = RUNNING
+            self._clock.value = max(self._clock.value, virtual_start)
+            self._cond.notify_all()
+        return slot, time.monotonic() - start
+
+    def release(self, ticket):
+        with self._cond:
+            self._calls[ticket].state = FREE
+            self._cond.notify_all()
+
+    def reap(self, pid):
+        """Free every call of a process that exited; returns how many were freed"""
+        with self._cond:
+            freed = 0
+            for call in self._calls:
+                if call.state != FREE and call.pid == pid:
+                    call.state = FREE
+                    freed += 1
+            if freed:
+                self._cond.notify_all()
+        return freed
+
+    def stats(self):
+        with self._cond:
+            running = self._counts(RUNNING)
+            waiting = self._counts(WAITING)
+        return {
+            name: {"running": running[lane], "waiting": waiting[lane]}
+            for lane, name in enumerate(LANES)
+        }
+
+
+SCHEDULER = OllamaScheduler()
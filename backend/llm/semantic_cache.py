@@ -0,0 +1,212 @@
+"""
+Semantic cache: reuse answers for paraphrased questions
+
+The translated query is embedded locally (Ollama embedding model, or hashed
+word and character n-grams when that model is not installed) and compared
+with recent queries by cosine similarity in one matrix product. A result is
+reused when the best similarity reaches the threshold and it was produced
+for the same dataset version and the question mentions the same numbers
+(years, quarters), since "Turnover in 2022" and "Turnover in 2023" embed
+almost identically.
+
+Hashed n-grams cannot tell "women" from "men", so with them only near-exact
+repeats are reused (EXACT_THRESHOLD). The embedding call is not queued in
+the Ollama scheduler; it gets a short timeout instead, and a request whose
+embedding times out (Ollama busy) simply skips the cache.
+
+The cached entries are per process, but the lookup and hit counters and the
+recent similarities live in shared memory created at import, so under the
+prefork server stats() reports every worker's traffic.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import requests
+
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "nomic-embed-text")
+SIMILARITY_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", "512"))
+# Seconds after which an entry's recency weight halves (for eviction)
+RECENCY_HALF_LIFE = 900
+HASHED_DIM = 1024
+# Threshold for hashed n-gram vectors: only (near) identical questions
+EXACT_THRESHOLD = 0.99
+# Seconds to wait for the embedding model before skipping the cache
+EMBED_TIMEOUT = 2
+# Best similarities of recent lookups kept for tuning the threshold
+SIMILARITY_HISTORY = 200
+# Retry the embedding model this long after it was found missing
+EMBED_RETRY_SECONDS = 300
+
+
+def _numbers(text):
+    return frozenset(re.findall(r"\d+", text))
+
+
+def _hashed_embedding(text):
+    """Feature-hashed bag of words and character trigrams"""
+    vector = np.zeros(HASHED_DIM, dtype=np.float32)
+    text = text.lower()
+    words = re.findall(r"\w+", text)
+    grams = words + [f"#{w[i:i + 3]}" for w in words for i in range(max(1, len(w) - 2))]
+    for gram in grams:
+        digest = hashlib.md5(gram.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % HASHED_DIM] += 1.0 if digest[4] & 1 else -1.0
+    return vector
+
+
+class Embedder:
+    """Embed text with Ollama, falling back to hashed n-grams
+
+    Returns (unit vector, kind) with kind "model" or "hashed", or
+    (None, None) when the model timed out.
+    """
+
+    def __init__(self, model=EMBED_MODEL):
+        self.model = model
+        self._unavailable_until = 0.0
+
+    def __call__(self, text, ctx=None):
+        vector, kind = None, "model"
+        if time.monotonic() >= self._unavailable_until:
+            try:
+                response = requests.post(
+                    "http://localhost:11434/api/embeddings",
+                    json={"model": self.model, "prompt": text},
+                    timeout=ctx.timeout(EMBED_TIMEOUT) if ctx else EMBED_TIMEOUT
+                )
+                if response.status_code == 200 and response.json().get("embedding"):
+                    vector = np.asarray(response.json()["embedding"], dtype=np.float32)
+            except requests.exceptions.Timeout:
+                # Ollama is busy, not missing: skip the cache for this query only
+                return None, None
+            except requests.exceptions.RequestException:
+                pass
+            if vector is None:
+                print(f"⚠️  Embedding model {self.model} unavailable, using hashed n-grams")
+                self._unavailable_until = time.monotonic() + EMBED_RETRY_SECONDS
+        if vector is None:
+            vector, kind = _hashed_embedding(text), "hashed"
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector), kind
+
+
+class SemanticCache:
+    """Bounded in-memory vector store of recent queries and their results"""
+
+    def __init__(self, capacity=CACHE_SIZE, threshold=SIMILARITY_THRESHOLD, embedder=None):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.embed = embedder or Embedder()
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._entries = []
+        self._version = None
+        self._kind = None
+        self._lookups = multiprocessing.Value("l", 0)
+        self._hits = multiprocessing.Value("l", 0)
+        # Ring buffer; the count's lock guards both
+        self._similarities = multiprocessing.Array("d", SIMILARITY_HISTORY, lock=False)
+        self._similarity_count = multiprocessing.Value("l", 0)
+
+    def _reset(self, version, kind, dim):
+        self._vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+        self._entries = []
+        self._version = version
+        self._kind = kind
+
+    def _prepare(self, version, kind, vector):
+        """Start over when the dataset version or the kind of embedding changed"""
+        if (self._version, self._kind) != (version, kind) or self._vectors is None \
+                or self._vectors.shape[1] != len(vector):
+            self._reset(version, kind, len(vector))
+
+    def lookup(self, query, vector, version, kind="model"):
+        """Best cached entry for this query: (result, similarity) or (None, similarity)"""
+        threshold = self.threshold if kind == "model" else max(self.threshold, EXACT_THRESHOLD)
+        with self._lock:
+            _increment(self._lookups)
+            self._prepare(version, kind, vector)
+            if not self._entries:
+                return None, 0.0
+
+            similarities = self._vectors[:len(self._entries)] @ vector
+            numbers = _numbers(query)
+            mismatched = [i for i, entry in enumerate(self._entries) if entry["numbers"] != numbers]
+            if len(mismatched) == len(self._entries):
+                return None, 0.0
+            similarities[mismatched] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            # Only comparable entries count towards the similarities kept for tuning
+            self._record_similarity(similarity)
+            if similarity < threshold:
+                return None, similarity
+
+            entry = self._entries[best]
+            entry["hits"] += 1
+            entry["last_used"] = time.monotonic()
+            _increment(self._hits)
+            return entry["result"], similarity
+
+    def _record_similarity(self, similarity):
+        with self._similarity_count.get_lock():
+            self._similarities[self._similarity_count.value % SIMILARITY_HISTORY] = round(similarity, 4)
+            self._similarity_count.value += 1
+
+    def _recent_similarities(self, limit=20):
+        with self._similarity_count.get_lock():
+            count = self._similarity_count.value
+            return [self._similarities[i % SIMILARITY_HISTORY]
+                    for i in range(max(0, count - min(limit, SIMILARITY_HISTORY)), count)]
+
+    def _eviction_slot(self):
+        """Entry with the least hits, discounted by time since last use"""
+        now = time.monotonic()
+        scores = [
+            (entry["hits"] + 1) * 0.5 ** ((now - entry["last_used"]) / RECENCY_HALF_LIFE)
+            for entry in self._entries
+        ]
+        return scores.index(min(scores))
+
+    def store(self, query, vector, result, version, kind="model"):
+        with self._lock:
+            self._prepare(version, kind, vector)
+            entry = {"query": query, "numbers": _numbers(query), "result": result,
+                     "hits": 0, "last_used": time.monotonic()}
+            if len(self._entries) < self.capacity:
+                slot = len(self._entries)
+                self._entries.append(entry)
+            else:
+                slot = self._eviction_slot()
+                self._entries[slot] = entry
+            self._vectors[slot] = vector
+
+    def stats(self):
+        """Counters of all workers; entries and embedding are this worker's (pid)"""
+        lookups, hits = self._lookups.value, self._hits.value
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "entries": len(self._entries),
+                "lookups": lookups,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "threshold": self.threshold if self._kind != "hashed" else max(self.threshold, EXACT_THRESHOLD),
+                "embedding": self._kind,
+                "recent_similarities": self._recent_similarities(),
+            }
+
+
+def _increment(counter):
+    with counter.get_lock():
+        counter.value += 1
+
+
+SEMANTIC_CACHE = SemanticCache()
@@ -0,0 +1,145 @@
+"""
+Precomputed table summaries, keyed by table content hash
+
+An offline job asks the LLM once per table for a compact description (what
+it measures, period coverage, key trends, extreme values) and stores it in
+data/table_summaries.json. Only tables whose content changed are summarized
+again. At query time the analysis prompt uses the summary plus a few
+matching rows instead of the full table.
+"""
+
+import json
+import os
+import re
+
+from mcp.dedup import content_hash, PAYLOAD_TYPES
+
+SUMMARY_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data", "table_summaries.json"))
+SUMMARY_NUM_PREDICT = 200
+# Rows sent alongside a summary in the analysis prompt
+SUMMARY_ROWS = 3
+
+
+def load_summaries(path=SUMMARY_FILE):
+    """Read the summary store ({hash: summary}); missing file means no summaries"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"⚠️  ცხრილების შეჯამებების წაკითხვა ვერ მოხერხდა: {e}")
+        return {}
+
+
+def summary_mtime(path=SUMMARY_FILE):
+    """Modification time of the summary store (None when it does not exist)"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def save_summaries(summaries, path=SUMMARY_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summaries, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _unique_tables(node, found=None):
+    """(hash, name, rows) for every distinct table in the tree"""
+    found = {} if found is None else found
+    if isinstance(node, list):
+        for item in node:
+            _unique_tables(item, found)
+    elif isinstance(node, dict):
+        if node.get("type") == "table":
+            digest = node.get("hash") or content_hash(node.get("data", []))
+            found.setdefault(digest, (node.get("name", ""), node.get("data", [])))
+        elif node.get("type") not in PAYLOAD_TYPES and isinstance(node.get("data"), list):
+            _unique_tables(node["data"], found)
+    return found
+
+
+def summary_prompt(name, table):
+    return f"""Table: "{name}"
+
+Data:
+{json.dumps(table, ensure_ascii=False, indent=1)}
+
+Describe this table in at most 5 short sentences:
+1. what it measures (indicators and units),
+2. which periods it covers,
+3. the key trends,
+4. the highest and lowest values and when they occurred.
+Use only numbers that appear in the data."""
+
+
+def summarize_tables(data, llm, path=SUMMARY_FILE, prune=True, skip=()):
+    """Summarize every table that has no summary for its current content
+
+    data can be one tree or a list of trees. Tables whose hash is in skip are
+    neither summarized nor kept (e.g. localized tables that reuse the summary
+    of an identical English table).
+    Returns (summaries, number of newly summarized tables).
+    """
+    summaries = load_summaries(path)
+    found = _unique_tables(data)
+    if not found:
+        # Most likely the data failed to load: keep the stored summaries
+        print("⚠️  ცხრილები ვერ მოიძებნა, შეჯამებები უცვლელია")
+        return summaries, 0
+    tables = {digest: table for digest, table in found.items() if digest not in skip}
+
+    stored = len(summaries)
+    if prune:
+        summaries = {digest: text for digest, text in summaries.items() if digest in tables}
+
+    created = 0
+    for digest, (name, table) in tables.items():
+        if digest in summaries or not table:
+            continue
+        print(f"📝 ვაჯამებ ცხრილს: {name}")
+        summary = llm(summary_prompt(name, table), num_predict=SUMMARY_NUM_PREDICT).strip()
+        if not summary or "შეცდომა" in summary:
+            print(f"⚠️  შეჯამება ვერ შეიქმნა: {summary}")
+            continue
+        summaries[digest] = summary
+        created += 1
+        # Save as we go so an interrupted job keeps its progress
+        save_summaries(summaries, path)
+
+    if created == 0 and len(summaries) != stored:
+        save_summaries(summaries, path)
+    print(f"✅ {created} new summaries, {len(summaries)} tables summarized in total")
+    return summaries, created
+
+
+def select_rows(table, query, limit=SUMMARY_ROWS):
+    """The rows that mention the most query words (first rows when none do)"""
+    words = {w for w in re.findall(r"[^\W_]+", query.lower()) if len(w) > 2}
+    scored = []
+    for position, row in enumerate(table):
+        text = " ".join(str(value).lower() for value in row.values())
+        score = sum(1 for w in words if w in text)
+        scored.append((-score, position, row))
+    scored.sort(key=lambda item: item[:2])
+    return [row for _, _, row in scored[:limit]]
+
+
+def compact_tables(tables, query, summaries, hashes):
+    """Replace tables that have a stored summary by the summary plus a few rows
+
+    hashes maps id(table) to the content hash stored when the data was loaded.
+    """
+    if not summaries:
+        return tables
+    compacted = []
+    for table in tables:
+        summary = summaries.get(hashes.get(id(table)))
+        if summary and len(table) > SUMMARY_ROWS:
+            compacted.append({"summary": summary, "selected_rows": select_rows(table, query)})
+        else:
+            compacted.append(table)
+    return compacted
@@ -6,14 +6,19 @@ Uses Ollama for local LLM processing without API keys
 
 import json
 import os
+import re
 import requests
-from llm.llm import llm_full_pipeline, call_ollama
+from functools import partial
+from llm.llm import llm_full_pipeline, call_ollama, STAGE_POOL
+from mcp.dedup import from_document, dedup_stats
+from mcp.bilingual import DATA_FILES, detect_language
+from llm.context import RequestContext
 from deep_translator import GoogleTranslator
 
-def load_data():
-    """Load scraped statistical data"""
+def load_data(language="en"):
+    """Load scraped statistical data in the given language edition ("en" or "ka")"""
     base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-    data_file = os.path.join(base_dir, "data", "scraped_data_mcp2.json")
+    data_file = os.path.join(base_dir, "data", DATA_FILES[language])
 
     print(f"🔍 Loading from: {data_file}")  # debug
 
@@ -24,22 +29,127 @@ def load_data():
 
     try:
         with open(data_file, "r", encoding="utf-8") as f:
-            return json.load(f)
+            data = from_document(json.load(f))
     except json.JSONDecodeError as e:
         print(f"❌ მონაცემების ფაილის წაკითხვის შეცდომა: {e}")
         return None
 
+    stats = dedup_stats(data)
+    print(f"🧬 {stats['unique_payloads']} unique tables/charts for {stats['payload_nodes']} "
+          f"tree locations (dedup ratio {stats['dedup_ratio']})")
+    return data
 
 
 
-def handle_user_query(query, data):
-    """Process user query through LLM pipeline"""
-    translator = GoogleTranslator(source="ka", target="en")
-    query = translator.translate(query)
 
-    
+class SentenceTranslator:
+    """Translate streamed text sentence by sentence while the rest is generated
+
+    The whitespace between sentences (spaces, line breaks, blank lines) is
+    kept as is, so lists and paragraphs keep their layout.
+    """
+
+    SENTENCE_END = re.compile(r"((?<=[.!?:])[ \t]+|[ \t]*\n\s*)")
+
+    def __init__(self, source="auto", target="ka"):
+        self.source = source
+        self.target = target
+        self.buffer = ""
+        self.fed = False
+        self.parts = []
+
+    def _translate(self, text):
+        return GoogleTranslator(source=self.source, target=self.target).translate(text) or ""
+
+    def _submit(self, text):
+        if text.strip():
+            self.parts.append(STAGE_POOL.submit(self._translate, text))
+        elif text:
+            self.parts.append(text)
+
+    def feed(self, chunk):
+        """Add streamed text; every completed sentence is sent for translation"""
+        self.fed = True
+        self.buffer += chunk
+        pieces = self.SENTENCE_END.split(self.buffer)
+        # pieces alternates text and separator, ending with the unfinished text
+        for position, piece in enumerate(pieces[:-1]):
+            if position % 2:
+                self.parts.append(piece)
+            else:
+                self._submit(piece)
+        self.buffer = pieces[-1]
+
+    def finish(self, full_text=""):
+        """Translate what is left and return the joined translation
+
+        If nothing was streamed, full_text is translated as a whole.
+        """
+        if not self.fed:
+            self.feed(full_text)
+        self._submit(self.buffer)
+        self.buffer = ""
+        return "".join(part if isinstance(part, str) else part.result() for part in self.parts).strip()
+
+    def cancel(self):
+        """Drop the translations that have not started yet (the request was abandoned)"""
+        for part in self.parts:
+            if not isinstance(part, str):
+                part.cancel()
+
+
+def _answer(query, data, index, ctx, on_analysis_chunk, summaries, cache, cache_scope, language):
+    """Answer from the semantic cache or run the pipeline (and cache the answer)"""
+    vector = None
+    if cache is not None:
+        with ctx.stage("cache_lookup"):
+            vector, kind = cache.embed(query, ctx)
+            cached, similarity = (None, 0.0) if vector is None else cache.lookup(query, vector, cache_scope, kind)
+        if cached is not None:
+            print(f"♻️  ნაპოვნია მსგავსი კითხვის პასუხი (similarity {similarity:.3f})")
+            return {**cached, "cache": {"hit": True, "similarity": round(similarity, 4)}, "timings": ctx.timings}
+
+    llm = partial(call_ollama, ctx=ctx)
+    result = llm_full_pipeline(query, data, llm, index, ctx, on_analysis_chunk, summaries, language)
+
+    if cache is not None:
+        # Only real answers are cached, not LLM failures or missing data
+        if vector is not None and result.get("answer_path") and not result.get("error"):
+            cache.store(query, vector, result, cache_scope, kind)
+        result["cache"] = {"hit": False, "similarity": round(similarity, 4)}
+    return result
+
+
+def handle_user_query(query, data, index=None, ctx=None, on_analysis_chunk=None, summaries=None,
+                      cache=None, dataset_version=None, localized=None):
+    """Process user query through LLM pipeline
+
+    ctx (an llm.context.RequestContext) carries the request deadline into the
+    translation and every Ollama call, so abandoned requests stop early.
+    With a cache (llm.semantic_cache.SemanticCache), answers to earlier
+    questions with the same meaning are reused for the same dataset_version.
+    localized maps a language to {"data", "index", "summaries"} of that
+    edition; questions in that language are answered from it directly, and
+    machine translation is only used when it has no matching data.
+    """
+    ctx = ctx or RequestContext()
+    language = detect_language(query)
+
+    edition = (localized or {}).get(language)
+    if edition is not None:
+        result = _answer(query, edition["data"], edition["index"], ctx, on_analysis_chunk,
+                         edition.get("summaries"), cache, f"{dataset_version}:{language}", language)
+        # An LLM failure would fail again after translation; only missing data falls back
+        if result.get("answer_path") or result.get("error"):
+            return result
+        print("🌐 ადგილობრივ ენაზე მონაცემები ვერ მოიძებნა, ვთარგმნი...")
+
+    ctx.check("translation")
+    with ctx.stage("translation"):
+        query = GoogleTranslator(source="ka", target="en").translate(query)
+
     print(query)
-    return llm_full_pipeline(query, data, call_ollama)
+    return _answer(query, data, index, ctx, on_analysis_chunk, summaries, cache, dataset_version, "en")
 
 def print_banner():
     """Print application banner"""
@@ -0,0 +1,89 @@
+"""
+Georgian and English editions of the dataset, aligned node by node
+
+Both scrapes walk the same Geostat pages, so nodes are matched by the page id
+in their source URL (/ka/modules/categories/195/... ↔ /en/modules/categories/195/...)
+and, within a page, by the position of the table or chart. The editions were
+scraped at different times, so a matched pair only counts as the same data when
+its numbers are identical.
+"""
+
+import hashlib
+import re
+
+from mcp.dedup import PAYLOAD_TYPES
+
+DATA_FILES = {
+    "en": "scraped_data_mcp2.json",
+    "ka": "scraped_data_mcp1.json",
+}
+
+
+def detect_language(text):
+    """"ka" when the text is mostly Georgian script, otherwise "en\""""
+    georgian = len(re.findall(r"[Ⴀ-ჿ]", text))
+    latin = len(re.findall(r"[A-Za-z]", text))
+    return "ka" if georgian > latin else "en"
+
+
+def source_key(url):
+    """Language-independent id of a Geostat page"""
+    match = re.search(r"/modules/categories/(\d+)", url or "")
+    return match.group(1) if match else url
+
+
+def numeric_fingerprint(payload):
+    """Hash of the numbers in a payload, row by row, ignoring labels and headers"""
+    rows = []
+    for row in payload or []:
+        if not isinstance(row, dict):
+            rows.append(re.findall(r"-?\d+(?:[.,]\d+)?", str(row)))
+            continue
+        values = [value for key, value in row.items() if key != ""] if "" in row else list(row.values())[1:]
+        rows.append([number for value in values for number in re.findall(r"-?\d+(?:[.,]\d+)?", str(value))])
+    return hashlib.sha1(repr(rows).encode("utf-8")).hexdigest()
+
+
+def _payload_positions(tree):
+    """{(page id, type, position on page): node} for every table and chart"""
+    positions = {}
+    counters = {}
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+        elif isinstance(node, dict):
+            if node.get("type") in PAYLOAD_TYPES:
+                page = (source_key(node.get("url")), node["type"])
+                position = counters.get(page, 0)
+                counters[page] = position + 1
+                positions[page + (position,)] = node
+            elif isinstance(node.get("data"), list):
+                walk(node["data"])
+
+    walk(tree)
+    return positions
+
+
+def align_trees(en_tree, localized_tree):
+    """Match a localized tree to the English one
+
+    Returns {"categories": {localized name: English name},
+             "payloads": {localized hash: English hash}}, where payloads only
+    has the matched tables and charts whose numbers are identical.
+    """
+    en_categories = {source_key(c.get("url")): c.get("name") for c in en_tree}
+    categories = {
+        c.get("name"): en_categories[source_key(c.get("url"))]
+        for c in localized_tree
+        if source_key(c.get("url")) in en_categories
+    }
+
+    en_payloads = _payload_positions(en_tree)
+    payloads = {}
+    for position, node in _payload_positions(localized_tree).items():
+        en_node = en_payloads.get(position)
+        if en_node is not None and numeric_fingerprint(node.get("data")) == numeric_fingerprint(en_node.get("data")):
+            payloads[node.get("hash")] = en_node.get("hash")
+    return {"categories": categories, "payloads": payloads}
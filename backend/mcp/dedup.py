@@ -0,0 +1,73 @@
+"""
+Content-addressed storage of table and chart payloads
+
+A compact dataset file looks like
+    {"format": "dedup-v1", "payloads": {hash: data, ...}, "tree": [...]}
+where every table/chart node in the tree carries "hash" instead of "data".
+The hash must stay identical to the one in data/scrapper.py.
+"""
+
+import hashlib
+import json
+
+COMPACT_FORMAT = "dedup-v1"
+PAYLOAD_TYPES = ("table", "chart")
+
+
+def content_hash(payload):
+    """Stable hash of a table/chart payload"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def _walk_payload_nodes(node):
+    if isinstance(node, dict):
+        if node.get("type") in PAYLOAD_TYPES:
+            yield node
+        elif isinstance(node.get("data"), list):
+            for item in node["data"]:
+                yield from _walk_payload_nodes(item)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _walk_payload_nodes(item)
+
+
+def intern_tree(tree, payloads=None):
+    """Give every table/chart node a "hash" and share one object per unique payload
+
+    Works on both layouts: nodes that only have "hash" get their data from
+    payloads, nodes that carry "data" are hashed and deduplicated in place.
+    """
+    payloads = {} if payloads is None else payloads
+    for node in _walk_payload_nodes(tree):
+        if "data" not in node:
+            node["data"] = payloads.get(node.get("hash"), [])
+            continue
+        digest = node.get("hash") or content_hash(node["data"])
+        node["hash"] = digest
+        node["data"] = payloads.setdefault(digest, node["data"])
+    return tree
+
+
+def from_document(document):
+    """Turn a loaded dataset file (legacy list or compact dict) into the tree"""
+    if isinstance(document, dict) and document.get("format") == COMPACT_FORMAT:
+        return intern_tree(document["tree"], dict(document["payloads"]))
+    return intern_tree(document)
+
+
+def dedup_stats(tree):
+    """How many table/chart references the tree has and how many are unique"""
+    hashes = [node.get("hash") for node in _walk_payload_nodes(tree)]
+    unique = len(set(hashes))
+    return {
+        "payload_nodes": len(hashes),
+        "unique_payloads": unique,
+        "dedup_ratio": round(len(hashes) / unique, 2) if unique else 1.0,
+    }
+
+
+def dataset_version(tree):
+    """Fingerprint of the dataset contents (changes when any table or chart does)"""
+    hashes = sorted({node.get("hash") or "" for node in _walk_payload_nodes(tree)})
+    return hashlib.sha1("\n".join(hashes).encode("utf-8")).hexdigest()[:16]
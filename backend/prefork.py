@@ -0,0 +1,190 @@
+"""
+Prefork multi-process server for the Flask API
+
+The parent loads the dataset and its indexes, opens the listening socket and
+then forks the workers, so every worker shares the same memory pages
+copy-on-write instead of loading its own copy. Each worker serves requests on
+a few threads and is recycled after a configured number of requests.
+
+An optional background job (e.g. table summaries) is also forked by the
+parent, on start or when a worker asks for it with request_job(), so it does
+not die with a recycled worker.
+"""
+
+import ctypes
+import gc
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+from llm.scheduler import SCHEDULER
+
+# Set in the parent before forking; workers use it to ask for the background job
+_parent_pid = None
+_job_running = multiprocessing.RawValue(ctypes.c_bool, False)
+
+
+def in_worker():
+    """Whether this process is a prefork worker"""
+    return _parent_pid is not None and os.getpid() != _parent_pid
+
+
+def request_job():
+    """Ask the parent to fork the background job; False if it is already running"""
+    if _job_running.value:
+        return False
+    os.kill(_parent_pid, signal.SIGUSR1)
+    return True
+
+
+def _open_listener(host, port):
+    """Open the shared listening socket in the parent"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _worker_loop(app, host, port, fd, max_requests, threads):
+    """Serve up to max_requests requests on the inherited socket, then exit
+
+    Requests run on a small thread pool, so cheap endpoints still answer while
+    other requests wait for Ollama. A connection is only accepted when a
+    thread is free, leaving the rest to the other workers.
+    """
+    server = make_server(host, port, app, fd=fd)
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="request")
+    free = threading.Semaphore(threads)
+    handled = 0
+
+    def run(request, client_address):
+        try:
+            server.finish_request(request, client_address)
+        except Exception:
+            server.handle_error(request, client_address)
+        finally:
+            server.shutdown_request(request)
+            free.release()
+
+    def process_request(request, client_address):
+        nonlocal handled
+        handled += 1
+        pool.submit(run, request, client_address)
+
+    server.process_request = process_request
+    try:
+        while not max_requests or handled < max_requests:
+            free.acquire()
+            before = handled
+            server.handle_request()
+            if handled == before:
+                free.release()
+    finally:
+        pool.shutdown(wait=True)
+        server.server_close()
+    print(f"♻️  Worker {os.getpid()} recycled after {handled} requests")
+
+
+def _fork(target, *args):
+    """Run target(*args) in a child process and return its pid"""
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        code = 0
+        try:
+            target(*args)
+        except Exception as e:
+            print(f"❌ Process {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(code)
+    return pid
+
+
+def serve_prefork(app, host="127.0.0.1", port=5000, workers=None, max_requests=1000, ollama_concurrency=1,
+                  threads=4, job=None, start_job=False):
+    """Fork workers that share the already-loaded dataset and one Ollama limit
+
+    When a worker exits for any reason (recycling, crash, SIGKILL), its queued
+    and running Ollama calls are reaped so their slots go back to the others.
+    job is forked on start (with start_job) and whenever a worker calls
+    request_job() while it is not running.
+    """
+    global _parent_pid
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Prefork mode requires os.fork (not available on this platform)")
+
+    workers = workers or os.cpu_count() or 1
+
+    # The scheduler state is shared by all workers, so Ollama sees at most this many generations
+    SCHEDULER.set_total_limit(ollama_concurrency)
+
+    listener = _open_listener(host, port)
+    fd = listener.fileno()
+
+    # Move everything loaded so far out of the collector's reach, so gc passes in
+    # the workers do not write to (and thereby copy) the shared dataset pages
+    gc.collect()
+    gc.freeze()
+
+    _parent_pid = os.getpid()
+    # pid -> "worker" or "job"
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run_job(signum=None, frame=None):
+        if job is None or stopping or _job_running.value:
+            return
+        _job_running.value = True
+        children[_fork(job)] = "job"
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, run_job)
+
+    for _ in range(workers):
+        children[_fork(_worker_loop, app, host, port, fd, max_requests, threads)] = "worker"
+    if start_job:
+        run_job()
+
+    print(f"🧩 Prefork server: {workers} workers x {threads} threads, {max_requests or '∞'} requests per worker, "
+          f"{ollama_concurrency} concurrent Ollama generations")
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        kind = children.pop(pid, None)
+        reaped = SCHEDULER.reap(pid)
+        if reaped:
+            print(f"🧹 Released {reaped} Ollama calls left by {kind} {pid}")
+        if kind == "job":
+            _job_running.value = False
+        elif not stopping:
+            children[_fork(_worker_loop, app, host, port, fd, max_requests, threads)] = "worker"
+
+    listener.close()
+    print("👋 Prefork server stopped")
@@ -0,0 +1,240 @@
+"""
+Opt-in profiling hooks for the API server
+
+- Sampled per-request wall-clock profiler, exported as collapsed stacks
+  (one "frame;frame;frame count" line per stack, ready for flamegraph.pl)
+- tracemalloc snapshots and diffs for dataset and index memory
+- Slow-query log with the full stage breakdown
+
+Nothing here runs unless it is switched on: with profiling disabled a request
+only pays for one shared-memory read.
+
+Settings live in shared memory and profiles are files in PROFILE_DIR named
+"<pid>-<counter>", so every prefork worker sees the same switch and any
+worker can return any profile.
+"""
+
+import collections
+import itertools
+import multiprocessing
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+# Admin endpoints and the X-Profile header need this token; unset disables them
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Shared so a change made through one worker applies to all of them
+PROFILING = {
+    "enabled": multiprocessing.Value("b", False),      # sample requests without an X-Profile header
+    "sample_rate": multiprocessing.Value("d", 0.0),    # fraction of requests sampled when enabled
+    "interval": multiprocessing.Value("d", 0.005),     # seconds between stack samples
+    "slow_query_seconds": multiprocessing.Value("d", float(os.environ.get("SLOW_QUERY_SECONDS", "20"))),
+}
+# Allowed range of each numeric setting
+SETTING_RANGES = {
+    "sample_rate": (0.0, 1.0),
+    "interval": (0.001, 1.0),
+    "slow_query_seconds": (0.0, float("inf")),
+}
+
+# Most recent request profiles, one collapsed-stack file each
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "geostat-profiles")
+MAX_PROFILES = 50
+PROFILE_ID = re.compile(r"\d+-\d+")
+_profile_ids = itertools.count(1)
+
+# Pool threads that work for requests; their stacks are sampled as well
+SAMPLED_THREAD_PREFIXES = ("stage", "ollama-stream")
+
+_last_snapshot = None
+
+
+def is_admin(headers):
+    return bool(ADMIN_TOKEN) and headers.get("X-Admin-Token") == ADMIN_TOKEN
+
+
+def profiling_settings():
+    return {
+        key: bool(value.value) if key == "enabled" else value.value
+        for key, value in PROFILING.items()
+    }
+
+
+def update_profiling(settings):
+    """Validate and apply new settings; raises ValueError without changing anything"""
+    for key, value in settings.items():
+        if key not in PROFILING:
+            raise ValueError(f"Unknown setting: {key}")
+        if key == "enabled":
+            if not isinstance(value, bool):
+                raise ValueError("enabled must be true or false")
+            continue
+        low, high = SETTING_RANGES[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+            raise ValueError(f"{key} must be a number between {low} and {high}")
+    for key, value in settings.items():
+        PROFILING[key].value = value
+
+
+class SamplingProfiler:
+    """Sample a request thread and the pool threads at a fixed interval from a background thread
+
+    Pool thread stacks start with the pool name ("stage", "ollama-stream").
+    The pools are shared, so with concurrent requests their samples include
+    work done for other requests too.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _sampled_threads(self):
+        """{thread id: stack prefix} of the threads to sample"""
+        threads = {self.thread_id: []}
+        for thread in threading.enumerate():
+            if thread.name.startswith(SAMPLED_THREAD_PREFIXES):
+                threads[thread.ident] = [thread.name.rsplit("_", 1)[0]]
+        return threads
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, prefix in self._sampled_threads().items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if prefix and names[0] == "thread.py:_worker":
+                    continue  # idle pool thread waiting for work
+                self.stacks[";".join(prefix + names[::-1])] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def start_request_profile(headers):
+    """Start a profiler for this request if asked to, otherwise return None"""
+    forced = headers.get("X-Profile") and is_admin(headers)
+    if not forced and (not PROFILING["enabled"].value or random.random() >= PROFILING["sample_rate"].value):
+        return None
+    return SamplingProfiler(threading.get_ident(), PROFILING["interval"].value).start()
+
+
+def _profile_path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+
+
+def list_profiles():
+    """Ids of the stored profiles, oldest first"""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".folded")]
+    except FileNotFoundError:
+        return []
+    stored = []
+    for name in names:
+        try:
+            stored.append((os.path.getmtime(os.path.join(PROFILE_DIR, name)), name[:-len(".folded")]))
+        except FileNotFoundError:
+            pass  # removed by another worker meanwhile
+    return [profile_id for _, profile_id in sorted(stored)]
+
+
+def finish_request_profile(profiler):
+    """Stop the profiler and store its stacks; returns the profile id"""
+    profiler.stop()
+    profile_id = f"{os.getpid()}-{next(_profile_ids)}"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(_profile_path(profile_id), "w", encoding="utf-8") as f:
+        f.write(profiler.collapsed())
+    for old_id in list_profiles()[:-MAX_PROFILES]:
+        try:
+            os.remove(_profile_path(old_id))
+        except FileNotFoundError:
+            pass
+    return profile_id
+
+
+def load_profile(profile_id):
+    """Collapsed stacks of a stored profile, or None"""
+    if not PROFILE_ID.fullmatch(profile_id):
+        return None
+    try:
+        with open(_profile_path(profile_id), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def log_slow_query(query, duration, ctx):
+    """Print the stage breakdown of queries slower than the threshold"""
+    if duration < PROFILING["slow_query_seconds"].value:
+        return
+    stages = ", ".join(f"{name}={seconds}s" for name, seconds in ctx.timings.items())
+    print(f"🐢 Slow query ({round(duration, 2)}s): {query!r} | {stages}, "
+          f"queue_wait={round(ctx.queue_wait, 3)}s")
+
+
+def memory_snapshot(limit=20):
+    """Take a tracemalloc snapshot of this process and diff it against its previous one
+
+    Tracing state and snapshots are per process: under the prefork server
+    each worker keeps its own, and the result names the worker ("pid") whose
+    memory it describes. The diff is always against that worker's own
+    previous snapshot.
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        return {"pid": os.getpid(), "tracing_started": True,
+                "note": "tracemalloc was off in this worker; take another snapshot to see allocations"}
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    current, peak = tracemalloc.get_traced_memory()
+    result = {
+        "pid": os.getpid(),
+        "traced_mb": round(current / 1e6, 2),
+        "peak_mb": round(peak / 1e6, 2),
+        "top": [
+            {"where": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]
+        ],
+    }
+    if _last_snapshot is not None:
+        result["diff"] = [
+            {"where": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1),
+             "count_diff": stat.count_diff}
+            for stat in snapshot.compare_to(_last_snapshot, "lineno")[:limit]
+        ]
+    _last_snapshot = snapshot
+    return result
+
+
+def start_tracemalloc_if_requested():
+    """Start tracing before the dataset loads when TRACEMALLOC=1 is set"""
+    if os.environ.get("TRACEMALLOC") == "1" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        print("🧮 tracemalloc started")
@@ -1,4 +1,12 @@
-from flask_api import app, initialize_data
+import os
+
+from flask_api import app, initialize_data, run_summary_job, start_summary_job, SUMMARIZE_ON_LOAD
+
+# Prefork mode: API_WORKERS > 1 forks that many workers after the data is loaded
+API_WORKERS = int(os.environ.get("API_WORKERS", "1"))
+MAX_REQUESTS_PER_WORKER = int(os.environ.get("MAX_REQUESTS_PER_WORKER", "1000"))
+OLLAMA_CONCURRENCY = int(os.environ.get("OLLAMA_CONCURRENCY", "1"))
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "4"))
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -11,14 +19,30 @@ if __name__ == '__main__':
         print("📡 Frontend can now connect to the API")
         print("💡 Use Ctrl+C to stop the server")
         print("=" * 60)
-        
-        # Start the Flask server
-        app.run(
-            host='127.0.0.1',
-            port=5000,
-            debug=True,
-            use_reloader=False  # Disable reloader to prevent data reloading issues
-        )
+
+        if API_WORKERS > 1:
+            from prefork import serve_prefork
+            serve_prefork(
+                app,
+                host='127.0.0.1',
+                port=5000,
+                workers=API_WORKERS,
+                max_requests=MAX_REQUESTS_PER_WORKER,
+                ollama_concurrency=OLLAMA_CONCURRENCY,
+                threads=WORKER_THREADS,
+                job=run_summary_job,
+                start_job=SUMMARIZE_ON_LOAD,
+            )
+        else:
+            if SUMMARIZE_ON_LOAD:
+                start_summary_job()
+            # Start the Flask server
+            app.run(
+                host='127.0.0.1',
+                port=5000,
+                debug=True,
+                use_reloader=False  # Disable reloader to prevent data reloading issues
+            )
     else:
         print("❌ Failed to initialize server")
         print("Please check Ollama connection and data files")
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+Precompute table summaries for the analysis prompt
+
+Run after scraping (or whenever the dataset changes); only new or changed
+tables are sent to the LLM. Georgian tables whose numbers match an English
+table reuse its summary; the others are summarized on their own.
+"""
+
+from functools import partial
+
+from mcp.app import load_data, check_ollama_connection
+from mcp.bilingual import align_trees
+from llm.llm import call_ollama
+from llm.context import RequestContext
+from llm.summaries import summarize_tables, SUMMARY_FILE
+
+if __name__ == '__main__':
+    if not check_ollama_connection():
+        print("❌ Ollama is required to summarize tables")
+    else:
+        data = load_data()
+        if data:
+            trees, reused = [data], set()
+            ka_data = load_data("ka")
+            if ka_data:
+                trees.append(ka_data)
+                reused = set(align_trees(data, ka_data)["payloads"])
+            ctx = RequestContext(lane="background", client="summarizer")
+            summarize_tables(trees, partial(call_ollama, ctx=ctx), skip=reused)
+            print(f"💾 Summaries saved to {SUMMARY_FILE}")
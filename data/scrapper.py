@@ -1,3 +1,4 @@
+import hashlib
 import html
 import json
 import requests
@@ -100,11 +101,65 @@ def extract_table_from_url(url):
         print(f"Error extracting table from {url}: {e}")
         return None
 
-def recursiveScrap(url, depth=0, max_depth=3):
-    """Recursively scrape data from Geostat pages"""
+def content_hash(payload):
+    """Stable hash of a table/chart payload (same as backend/mcp/dedup.py)"""
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def compact_tree(tree):
+    """Store each unique table/chart payload once and reference it by hash"""
+    payloads = {}
+
+    def walk(node):
+        if isinstance(node, list):
+            return [walk(item) for item in node]
+        if node.get("type") in ("table", "chart"):
+            digest = content_hash(node["data"])
+            payloads.setdefault(digest, node["data"])
+            return {**{key: value for key, value in node.items() if key != "data"}, "hash": digest}
+        if isinstance(node.get("data"), list):
+            return {**node, "data": walk(node["data"])}
+        return node
+
+    compact = walk(tree)
+    return {"format": "dedup-v1", "payloads": payloads, "tree": compact}
+
+
+def count_references(node):
+    if isinstance(node, list):
+        return sum(count_references(item) for item in node)
+    if "hash" in node:
+        return 1
+    return count_references(node["data"]) if isinstance(node.get("data"), list) else 0
+
+
+def save_compact(tree, path):
+    document = compact_tree(tree)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=1)
+    references = count_references(document["tree"])
+    print(f"🧬 {len(document['payloads'])} unique tables/charts for {references} tree locations "
+          f"(dedup ratio {round(references / max(len(document['payloads']), 1), 2)})")
+
+
+def recursiveScrap(url, depth=0, max_depth=3, visited=None):
+    """Recursively scrape data from Geostat pages
+
+    Pages reachable by several paths are scraped once; a later path reuses the
+    result when it was scraped at the same or a shallower depth (and so with at
+    least as many sub-folder levels). Reached higher up, the page is scraped again.
+    """
     if depth > max_depth:
         return []
-        
+
+    if visited is None:
+        visited = {}
+    if url in visited:
+        scraped_depth, result = visited[url]
+        if scraped_depth <= depth:
+            return result
+
     try:
         response = requests.get(url)
         response.raise_for_status()
@@ -145,15 +200,17 @@ def recursiveScrap(url, depth=0, max_depth=3):
     # Get subfolders recursively
     folders = extractFolders(url)
     for folder_url in folders[:5]:  # Limit to first 5 subfolders to avoid too much data
-        sub_data = recursiveScrap(folder_url, depth + 1, max_depth)
+        sub_data = recursiveScrap(folder_url, depth + 1, max_depth, visited)
         folder_data.extend(sub_data)
 
-    return [{
+    result = [{
         "name": name,
         "url": url,
         "type": "folder",
         "data": folder_data
     }] if folder_data else []
+    visited[url] = (depth, result)
+    return result
 
 def scrapData(categories=None):
     """Main scraping function"""
@@ -170,6 +227,7 @@ def scrapData(categories=None):
         ]
 
     all_data = []
+    visited = {}
 
     for url in categories:
         try:
@@ -186,7 +244,7 @@ def scrapData(categories=None):
         category_name = name_tag.text.strip() if name_tag else url.split('/')[-1]
 
         print(f"📁 Scraping category: {category_name}")
-        result = recursiveScrap(url)
+        result = recursiveScrap(url, visited=visited)
         
         if result:
             all_data.append({
@@ -196,12 +254,22 @@ def scrapData(categories=None):
                 "data": result
             })
 
-    # Save structured data
-    with open("scraped_data_mcp2.json", "w", encoding="utf-8") as f:
-        json.dump(all_data, f, ensure_ascii=False, indent=2)
-        print(f"✅ Saved {len(all_data)} categories to data/scraped_data_mcp2.json")
+    # Save structured data, each unique table/chart stored once
+    save_compact(all_data, "scraped_data_mcp2.json")
+    print(f"✅ Saved {len(all_data)} categories to data/scraped_data_mcp2.json")
 
 if __name__ == "__main__":
     import os
-    os.makedirs("data", exist_ok=True)
-    scrapData()
\ No newline at end of file
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] == "--compact":
+        # Rewrite an existing (legacy) dataset file in the deduplicated format
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            tree = json.load(f)
+        if isinstance(tree, list):
+            save_compact(tree, sys.argv[2])
+        else:
+            print(f"{sys.argv[2]} is already compact")
+    else:
+        os.makedirs("data", exist_ok=True)
+        scrapData()
\ No newline at end of file